@@ -3,8 +3,10 @@ SolarmanPV - Collect PV data from the SolarmanPV API and send Power+Energy data
 """
 
 import argparse
+import logging
 import sys
 
+from .api import SolarmanApiError
 from .solarmanpv import SolarmanPV
 
 
@@ -43,11 +45,17 @@ def main():
     args = parser.parse_args()
     solarman = SolarmanPV(args.file)
     if args.single:
-        solarman.single_run_loop()
+        try:
+            solarman.single_run_loop()
+        except SolarmanApiError as error:
+            logging.error("Error on single run: %s", str(error))
+            sys.exit(1)
+        finally:
+            solarman.close()
     elif args.daemon:
         solarman.daemon(args.interval)
     elif args.validate:
-        solarman.validate_config(args.file)
+        solarman.validate_config()
     elif args.create_passhash:
         solarman.create_passhash(args.create_passhash)
     else:
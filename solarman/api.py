@@ -3,11 +3,145 @@ Api
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import logging
-import sys
+import os
+import threading
 import time
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from hashlib import sha256
+from typing import Any, Callable, Optional
+
+loads: Callable[[bytes | str], Any]
+dumps: Callable[[Any], bytes]
+try:
+    import orjson
+
+    loads = orjson.loads
+    dumps = orjson.dumps
+except ImportError:
+    loads = json.loads
+    # match orjson.dumps, which returns bytes
+    dumps = lambda obj: json.dumps(obj).encode()  # noqa: E731
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+DECODE_ERRORS: tuple = (json.JSONDecodeError,)
+if ijson is not None:
+    DECODE_ERRORS += (ijson.JSONError,)
+
+# currentData responses larger than this are stream-parsed when ijson is available
+STREAM_PARSE_THRESHOLD = 16_384
+STREAM_CHUNK_SIZE = 8_192
+
+TOKEN_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "solarman-mqtt")
+# do not reuse a cached token this close to its expiry
+TOKEN_EXPIRY_MARGIN = 60
+# connect() tries this many times to get a token before giving up,
+# each attempt is a single token request without _make_request's own retries
+TOKEN_ATTEMPTS = 5
+
+
+class SolarmanApiError(Exception):
+    """
+    The API did not return data needed to continue
+    """
+
+
+class SolarmanAuthError(SolarmanApiError):
+    """
+    Unable to get an access token from the API
+    """
+
+
+class SolarmanCredentialsError(SolarmanAuthError):
+    """
+    The API rejected the token request, retrying will not help
+    """
+
+
+class _ResponseReader:
+    """
+    Minimal file-like view of a streamed response body for ijson
+    """
+
+    def __init__(self, response: requests.Response):
+        self._chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+        self._buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        """Return up to size bytes, fewer only at the end of the body."""
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def decode_response(response: requests.Response) -> dict:
+    """
+    Decode a JSON response
+    :return: response data
+    """
+    return loads(response.content)
+
+
+def decode_current_data(response: requests.Response) -> dict:
+    """
+    Decode a device currentData response
+    Large responses are parsed while they are read from the connection,
+    dataList rows never hold more than name and value
+    :return: current data
+    """
+    length = response.headers.get("Content-Length")
+    # for compressed bodies Content-Length says nothing about the decoded size
+    small = (
+        length is not None
+        and not response.headers.get("Content-Encoding")
+        and int(length) < STREAM_PARSE_THRESHOLD
+    )
+    if ijson is None or small:
+        return loads(response.content)
+
+    data: dict = {}
+    rows: list = []
+    row: dict = {}
+    key = None
+    builder = None
+    for prefix, event, value in ijson.parse(_ResponseReader(response), use_float=True):
+        if builder is not None:
+            # a top-level container other than dataList, keep it as-is
+            builder.event(event, value)
+            if prefix == key and event in ("end_map", "end_array"):
+                data[key] = builder.value
+                builder = None
+        elif prefix == "dataList.item":
+            if event == "end_map":
+                rows.append(row)
+                row = {}
+        elif prefix in ("dataList.item.name", "dataList.item.value"):
+            row[prefix[14:]] = value
+        elif prefix == "" and event == "map_key":
+            key = value
+        elif prefix == "dataList" and event in ("start_array", "end_array"):
+            data["dataList"] = rows
+        elif prefix == key:
+            if event in ("start_map", "start_array"):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            else:
+                data[key] = value
+    return data
 
 
 class SolarmanApi:
@@ -18,67 +152,145 @@ class SolarmanApi:
     def __init__(self, config):
         self.config = config
         self.url = "https://globalapi.solarmanpv.com"
-        self.token = self.get_token(
-            self.config["appid"],
-            self.config["secret"],
-            self.config["username"],
-            self.config["passhash"],
+        self._url_token = self.url + "/account/v1.0/token"
+        self._url_stations = self.url + "/station/v1.0/list?language=en"
+        self._url_devices = self.url + "/station/v1.0/device?language=en"
+        self._url_realtime = self.url + "/station/v1.0/realTime?language=en"
+        self._url_current = self.url + "/device/v1.0/currentData?language=en"
+
+        # one pooled session so every call reuses the same TCP/TLS connection
+        self._session = requests.Session()
+        self._session.headers.update({
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+            "Accept-Encoding": "gzip, deflate",
+        })
+        # quick transport-level retries only for connections that could not be
+        # established; HTTP errors and read timeouts are left to the backoff in
+        # _make_request so the two retry layers do not multiply
+        retries = Retry(total=3, connect=3, read=0, status=0, other=0, backoff_factor=0.3)
+        self._session.mount(
+            "https://",
+            HTTPAdapter(pool_connections=2, pool_maxsize=8, max_retries=retries),
         )
+        # workers for the concurrent polling requests in get_data
+        self._executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="solarman-api")
+
+        self._token_cache = os.path.join(
+            TOKEN_CACHE_DIR,
+            "token-"
+            + sha256(f"{config['appid']}:{config['username']}".encode()).hexdigest()[:16]
+            + ".json",
+        )
+        self.token = ""
+        # unix time the current token expires, 0 when unknown
+        self._token_expires_at: float = 0
+        # polling threads may all see an expired token at once, refresh only once
+        self._token_lock = threading.Lock()
+        self.station_id: int = 0
         self.inverter_id: int = 0
         self.inverter_sn: str = ''
         self.logger_id: int = 0
         self.logger_sn: str = ''
 
+    def connect(self) -> None:
+        """
+        Authenticate and look up the station, inverter and logger
+        Call once before polling with get_data
+        """
+        token = self._load_cached_token()
+        attempt = 0
+        while token is None:
+            try:
+                token = self.get_token(
+                    self.config["appid"],
+                    self.config["secret"],
+                    self.config["username"],
+                    self.config["passhash"],
+                    max_retries=0,
+                )
+            except SolarmanCredentialsError:
+                raise
+            except SolarmanAuthError as error:
+                if attempt == TOKEN_ATTEMPTS - 1:
+                    raise
+                delay = min(60, 2 ** attempt)
+                logging.warning(f"{error}, retrying in {delay}s")
+                time.sleep(delay)
+                attempt += 1
+        self._set_token(token)
+
         logging.info(f"Starting API with URL: {self.url}")
 
         station_id = self.get_station()
         if station_id == 0:
-            self.station_id = int(config["stationId"])
+            self.station_id = int(self.config["stationId"])
             logging.warning(f"Unable to find useful stationList.  Using configured stationId {self.station_id}")
         else:
             logging.info(f"Using retrieved stationId {station_id}")
             self.station_id = station_id
 
+        # the request payloads never change, so serialize them only once
+        self._station_body = dumps({"stationId": self.station_id})
+
         self.station_device_list = self.get_station_device_list()
 
-        self.get_data()
+        self._poll_inverter = partial(
+            self.get_device_current_data,
+            self._device_body(self.inverter_sn, self.inverter_id),
+        )
+        self._poll_logger = partial(
+            self.get_device_current_data,
+            self._device_body(self.logger_sn, self.logger_id),
+        )
+
+    def close(self) -> None:
+        """Close the pooled connections and polling workers."""
+        self._executor.shutdown(wait=False)
+        self._session.close()
 
     def _make_request(
         self,
         url: str,
-        headers: dict,
-        data: dict,
+        data: dict | bytes,
+        params: Optional[dict] = None,
         operation: str = "request",
         max_retries: int = 5,
-        retry_delay: float = 10.0
+        retry_delay: float = 10.0,
+        reauthenticate: bool = True,
+        decode: Callable[[requests.Response], dict] = decode_response,
+        raise_client_errors: bool = False
     ) -> Optional[dict]:
         """
         Centralized request handler with comprehensive error handling and automatic retries.
 
         :param url: The full URL to request
-        :param headers: Request headers
-        :param data: Request payload (will be JSON encoded)
+        :param data: Request payload (JSON encoded unless already bytes)
+        :param params: Query string parameters
         :param operation: Description of the operation for logging
         :param max_retries: Maximum number of retry attempts (default: 3)
         :param retry_delay: Initial delay between retries in seconds (default: 1.0)
+        :param reauthenticate: Fetch a new token and retry once on HTTP 401
+        :param decode: Function turning the response into a dict
+        :param raise_client_errors: Raise HTTPError on 4xx responses instead of returning None
         :return: Response data as dict, or None on error
         """
-        for attempt in range(max_retries + 1):
+        body = data if isinstance(data, bytes) else dumps(data)
+        attempt = 0
+        while True:
             try:
-                if attempt > 0:
-                    # Exponential backoff: delay increases with each retry
-                    delay = retry_delay * (2 ** (attempt - 1))
-                    logging.info(f"Retrying {operation} (attempt {attempt + 1}/{max_retries + 1}) after {delay:.1f}s delay")
-                    time.sleep(delay)
-
-                response = requests.post(
-                    url=url,
-                    headers=headers,
-                    data=json.dumps(data),
-                    timeout=30
-                )
-                response.raise_for_status()
-                return response.json()
+                authorization = self._session.headers.get("Authorization")
+                # streamed so decode can parse the body as it arrives
+                with self._session.post(
+                    url, params=params, data=body, timeout=30, stream=True
+                ) as response:
+                    response.raise_for_status()
+                    logging.debug(
+                        "Response for %s: Content-Encoding %s",
+                        operation,
+                        response.headers.get("Content-Encoding"),
+                    )
+                    return decode(response)
 
             except requests.exceptions.Timeout as error:
                 logging.warning(f"Request timeout during {operation} (attempt {attempt + 1}/{max_retries + 1}): {error}")
@@ -94,15 +306,25 @@ class SolarmanApi:
                 # Don't retry on 4xx client errors (bad request, unauthorized, etc.)
                 # Only retry on 5xx server errors and 429 (too many requests)
                 status_code = error.response.status_code
+                if status_code == 401 and reauthenticate:
+                    # the (possibly cached) token is no longer accepted
+                    logging.warning(f"Access token rejected during {operation}, requesting a new one")
+                    reauthenticate = False
+                    self._refresh_token(authorization)
+                    # retry right away with the new token, this is not a failed attempt
+                    continue
+
                 if 400 <= status_code < 500 and status_code != 429:
                     logging.error(f"HTTP client error {status_code} during {operation}: {error}")
+                    if raise_client_errors:
+                        raise
                     return None
 
                 logging.warning(f"HTTP error {status_code} during {operation} (attempt {attempt + 1}/{max_retries + 1}): {error}")
                 if attempt == max_retries:
                     logging.error(f"Max retries exceeded for HTTP error {status_code} during {operation}")
 
-            except json.JSONDecodeError as error:
+            except DECODE_ERRORS as error:
                 # JSON decode errors are unlikely to be fixed by retrying
                 logging.error(f"Invalid JSON response during {operation}: {error}")
                 return None
@@ -112,28 +334,115 @@ class SolarmanApi:
                 if attempt == max_retries:
                     logging.error(f"Max retries exceeded for request failure during {operation}")
 
-        return None
+            attempt += 1
+            if attempt > max_retries:
+                return None
+
+            # Exponential backoff: delay increases with each retry
+            delay = retry_delay * (2 ** (attempt - 1))
+            logging.info(f"Retrying {operation} (attempt {attempt + 1}/{max_retries + 1}) after {delay:.1f}s delay")
+            time.sleep(delay)
 
-    def get_token(self, appid, secret, username, passhash):
+    def get_token(self, appid, secret, username, passhash, max_retries=5):
         """
         Get a token from the API
+        :param max_retries: Retries for a failed request, see _make_request
+        :raises SolarmanCredentialsError: when the API rejects the request
+        :raises SolarmanAuthError: when no token could be retrieved
         :return: access_token
         """
-        data = self._make_request(
-            url=self.url + f"/account/v1.0/token?appId={appid}&language=en",
-            headers={"Content-Type": "application/json"},
-            data={"appSecret": secret, "email": username, "password": passhash},
-            operation="getting access token"
-        )
+        try:
+            data = self._make_request(
+                url=self._url_token,
+                data={"appSecret": secret, "email": username, "password": passhash},
+                params={"appId": appid, "language": "en"},
+                operation="getting access token",
+                max_retries=max_retries,
+                reauthenticate=False,
+                raise_client_errors=True
+            )
+        except requests.exceptions.HTTPError as error:
+            raise SolarmanCredentialsError(f"Token request rejected: {error}") from error
 
         if data is None:
-            logging.error("Unable to get access token")
-            sys.exit(1)
+            raise SolarmanAuthError("Unable to get access token")
 
         self.check_response(data)
+        if "access_token" not in data:
+            # e.g. wrong username or password
+            raise SolarmanCredentialsError(f"No access token in response: {data.get('msg', 'none')}")
+
         logging.debug("Received token")
+        expires_in = int(data.get("expires_in", 0))
+        self._token_expires_at = time.time() + expires_in if expires_in > 0 else 0
+        self._save_cached_token(data["access_token"], expires_in)
         return data["access_token"]
 
+    def _set_token(self, token: Optional[str] = None) -> None:
+        """
+        Use the given token, or request a new one, for all following requests
+        :param token: Previously obtained access token
+        """
+        if token is None:
+            token = self.get_token(
+                self.config["appid"],
+                self.config["secret"],
+                self.config["username"],
+                self.config["passhash"],
+            )
+        self.token = token
+        # sent with every request on the session, no per-call headers needed
+        self._session.headers["Authorization"] = "bearer " + token
+
+    def _refresh_token(self, rejected: Optional[str]) -> None:
+        """
+        Drop the cached token and request a new one
+        :param rejected: Authorization header the API rejected
+        """
+        with self._token_lock:
+            if self._session.headers.get("Authorization") != rejected:
+                # another request already replaced the rejected token
+                return
+
+            try:
+                os.remove(self._token_cache)
+            except OSError:
+                pass
+
+            self._set_token()
+
+    def _load_cached_token(self) -> Optional[str]:
+        """
+        Return a previously stored token if it is still valid
+        :return: access_token or None
+        """
+        try:
+            with open(self._token_cache, "rb") as cache_file:
+                cached = loads(cache_file.read())
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(cached, dict) or cached.get("expires_at", 0) <= time.time() + TOKEN_EXPIRY_MARGIN:
+            return None
+
+        logging.debug("Using cached token")
+        self._token_expires_at = cached["expires_at"]
+        return cached.get("token")
+
+    def _save_cached_token(self, token: str, expires_in: int) -> None:
+        """Store the token so later runs can skip the token request."""
+        if expires_in <= 0:
+            return
+
+        try:
+            os.makedirs(TOKEN_CACHE_DIR, mode=0o700, exist_ok=True)
+            # the token grants API access, keep it private to this user
+            fd = os.open(self._token_cache, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as cache_file:
+                cache_file.write(dumps({"token": token, "expires_at": time.time() + expires_in}))
+        except OSError as error:
+            logging.warning(f"Unable to cache access token: {error}")
+
     def get_station(self)->int:
         """
         Return station realtime data
@@ -142,11 +451,7 @@ class SolarmanApi:
         logging.info(f"Requesting station list")
 
         data = self._make_request(
-            url=self.url + "/station/v1.0/list?language=en",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": "bearer " + self.token,
-            },
+            url=self._url_stations,
             data={"page": 1, "size": 50},
             operation="getting station list"
         )
@@ -155,8 +460,8 @@ class SolarmanApi:
             return 0
 
         self.check_response(data)
-        logging.info(f"station list: {data}")
-        logging.info(f"Found stationList with {len(data['stationList'])} entries")
+        logging.info("station list: %s", data)
+        logging.info("Found stationList with %d entries", len(data["stationList"]))
 
         if not data["stationList"]:
             return 0
@@ -164,48 +469,57 @@ class SolarmanApi:
         return int(data["stationList"][0]["id"])
 
     def get_station_device_list(self):
-        """Find the inverter and logger IDs."""
+        """
+        Find the inverter and logger IDs
+        :raises SolarmanApiError: when the device list cannot be retrieved
+        """
         logging.info(f"Requesting device list")
 
         data = self._make_request(
-            url=self.url + "/station/v1.0/device",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": "bearer " + self.token,
-            },
-            data={"stationId": self.station_id},
+            url=self._url_devices,
+            data=self._station_body,
             operation="getting device list"
         )
 
-        if data is None:
-            return
+        if data is None or "deviceListItems" not in data:
+            # without the device IDs every poll would request an empty deviceSn
+            raise SolarmanApiError("Unable to get station device list")
 
         device_list = data["deviceListItems"]
-        logging.debug(f"Found deviceListItems with {len(device_list)} items")
+        logging.debug("Found deviceListItems with %d items", len(device_list))
 
+        targets = {
+            "INVERTER": ("inverter", "inverter_id", "inverter_sn"),
+            "COLLECTOR": ("logger", "logger_id", "logger_sn"),
+        }
         for device in device_list:
-            if device["deviceType"]=="INVERTER":
-                logging.info(f"Found inverter with SN {device['deviceSn']} and ID {device['deviceId']}")
-                self.inverter_id = int(device["deviceId"])
-                self.inverter_sn = device['deviceSn']
-            if device["deviceType"]=="COLLECTOR":
-                logging.info(f"Found logger with SN {device['deviceId']} and ID {device['deviceId']}")
-                self.logger_id = int(device["deviceId"])
-                self.logger_sn = device['deviceSn']
+            target = targets.pop(device["deviceType"], None)
+            if target is None:
+                continue
+            name, id_attr, sn_attr = target
+            logging.info("Found %s with SN %s and ID %s", name, device["deviceSn"], device["deviceId"])
+            setattr(self, id_attr, int(device["deviceId"]))
+            setattr(self, sn_attr, device["deviceSn"])
+            if not targets:
+                # both inverter and logger found
+                break
 
     def get_data(self):
         """Get recurring data."""
-        self.station_realtime = self.get_station_realtime()
+        if self._token_expires_at and time.time() + TOKEN_EXPIRY_MARGIN >= self._token_expires_at:
+            # replace the token before the API starts rejecting it
+            logging.info("Access token about to expire, requesting a new one")
+            self._refresh_token(self._session.headers.get("Authorization"))
 
-        self.device_current_data_inverter = self.get_device_current_data(
-            self.inverter_sn,
-            self.inverter_id
-        )
-        self.device_current_data_logger = self.get_device_current_data(
-            self.logger_sn,
-            self.logger_id
-        )
-        
+        # the three requests are independent, so issue them concurrently;
+        # currentData takes a single device, so inverter and logger need one call each
+        station_realtime = self._executor.submit(self.get_station_realtime)
+        inverter = self._executor.submit(self._poll_inverter)
+        logger = self._executor.submit(self._poll_logger)
+
+        self.station_realtime = station_realtime.result()
+        self.device_current_data_inverter = inverter.result()
+        self.device_current_data_logger = logger.result()
 
     def get_station_realtime(self):
         """
@@ -213,12 +527,8 @@ class SolarmanApi:
         :return: realtime data
         """
         data = self._make_request(
-            url=self.url + "/station/v1.0/realTime?language=en",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": "bearer " + self.token,
-            },
-            data={"stationId": self.station_id},
+            url=self._url_realtime,
+            data=self._station_body,
             operation="getting station realtime data"
         )
 
@@ -228,49 +538,55 @@ class SolarmanApi:
         self.check_response(data)
         return data
 
-    def get_device_current_data(self, device_sn: str, device_id: int):
+    @staticmethod
+    def _device_body(device_sn: str, device_id: int) -> bytes:
         """
-        Return device current data
-        :return: current data
+        Return the serialized currentData request body for a device
+        :return: JSON encoded payload
         """
         payload: dict[str, str | int]
         if device_id == 0:
             payload = {"deviceSn": device_sn}
         else:
             payload = {"deviceSn":device_sn,"deviceId": device_id}
+        return dumps(payload)
 
+    def get_device_current_data(self, payload: bytes):
+        """
+        Return device current data
+        :param payload: Serialized request body from _device_body
+        :return: current data
+        """
         data = self._make_request(
-            url=self.url + "/device/v1.0/currentData?language=en",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": "bearer " + self.token,
-            },
+            url=self._url_current,
             data=payload,
-            operation="getting device current data"
+            operation="getting device current data",
+            decode=decode_current_data
         )
 
         if data is None:
             return None
 
         self.check_response(data)
-        logging.info(f"current_data:\n{data}")
+        logging.debug("current_data:\n%s", data)
         return data
 
     def check_response(self, response: dict) -> None:
         """Check the response for various error codes."""
-        if not response:
-            logging.warning("Server returned empty response")
+        if response.get("success"):
+            # no problems here
             return
 
-        if response.get("success", False):
-            # no problems here
+        if not response:
+            logging.warning("Server returned empty response")
             return
 
-        code = int(response.get("code", 0))
+        # the API returns codes as strings or ints
+        code = response.get("code")
 
         # Code: 2101006. Message: invalid param
 
-        if code==2101009:
+        if code == 2101009 or code == "2101009":
             # 'msg': 'appId or api is locked'
             logging.critical("AppId or API is locked")
             # TODO: some sort of timer to retry?
@@ -288,16 +604,20 @@ class ConstructData:  # pylint: disable=too-few-public-methods
     :return: new current data
     """
 
+    _NAME_XLATE = str.maketrans(" ", "_")
+
     def __init__(self, data):
         self.data = data
         self.device_current_data = {}
+        xlate = self._NAME_XLATE
         try:
-            for i in self.data["dataList"]:
-                del i["key"]
-                name = i["name"]
-                name = name.replace(" ", "_")
-                del i["name"]
-                self.device_current_data[name] = i["value"]
-            del self.data["dataList"]
-        except KeyError:
+            self.device_current_data = {
+                item["name"].translate(xlate): item["value"]
+                for item in self.data["dataList"]
+            }
+        except (KeyError, TypeError):
+            # no usable dataList, including a failed request (data is None)
             pass
+        if isinstance(self.data, dict):
+            # never published as a topic, even when it is null
+            self.data.pop("dataList", None)
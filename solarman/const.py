@@ -1,5 +1,10 @@
 """Constants"""
 
+from jsonschema import Draft202012Validator
+
+# API response status fields, not published to MQTT
+RESPONSE_STATUS_FIELDS = frozenset(("success", "code", "msg"))
+
 SCHEMA = {
     "$schema": "https://json-schema.org/draft/2020-12/schema",
     "title": "solarman-mqtt-schema",
@@ -43,3 +48,6 @@ SCHEMA = {
         },
     },
 }
+
+# built once, jsonschema.validate() would rebuild the validator on every call
+VALIDATOR = Draft202012Validator(SCHEMA)
@@ -38,8 +38,19 @@ class Mqtt:
         client = mqtt_client.Client(client_id=client_id, callback_api_version=CallbackAPIVersion.VERSION1)
         client.username_pw_set(self.username, self.password)
         client.connect(self.broker, self.port)
+        # network loop keeps the connection alive (and reconnects) between runs
+        client.loop_start()
         return client
 
+    def disconnect(self):
+        """
+        Close the MQTT connection
+        :return:
+        """
+        # disconnect first so queued messages are flushed by the network loop
+        self.client.disconnect()
+        self.client.loop_stop()
+
     def publish(self, topic, msg):
         """
         Publish a message on a MQTT topic
@@ -55,3 +66,12 @@ class Mqtt:
             logging.debug("Send %s to %s", msg, topic)
         else:
             logging.error("Failed to send message to topic %s", topic)
+
+    def publish_many(self, messages):
+        """
+        Publish several messages over the open connection
+        :param messages: Iterable of (topic, msg) tuples
+        :return:
+        """
+        for topic, msg in messages:
+            self.publish(topic, msg)
@@ -8,11 +8,10 @@ import sys
 import time
 from hashlib import sha256
 
-from jsonschema import validate
-from jsonschema.exceptions import SchemaError, ValidationError
+from jsonschema.exceptions import ValidationError
 
-from .api import ConstructData, SolarmanApi
-from .const import SCHEMA
+from .api import ConstructData, SolarmanApi, SolarmanApiError, SolarmanCredentialsError, dumps
+from .const import RESPONSE_STATUS_FIELDS, VALIDATOR
 from .mqtt import Mqtt
 
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +24,9 @@ class SolarmanPV:
 
     def __init__(self, file):
         self.config = self.load_config(file)
+        # connected clients per config instance, reused across daemon runs
+        self._apis: dict[int, SolarmanApi] = {}
+        self._mqtts: dict[int, Mqtt] = {}
 
     def load_config(self, file):
         """
@@ -39,39 +41,66 @@ class SolarmanPV:
 
         return config
 
-    def validate_config(self, config):
+    def validate_config(self):
         """
-        Validate config file
-        :param file: Config file
+        Validate the loaded config file
         :return:
         """
-        config = self.load_config(config)
-        for conf in config:
+        config = self.config
+        total = len(config)
+        for idx, conf in enumerate(config, 1):
             print(
-                f"## CONFIG INSTANCE NAME: {conf['name']} [{config.index(conf) + 1}/{len(config)}]"
+                f"## CONFIG INSTANCE NAME: {conf['name']} [{idx}/{total}]"
             )
             try:
-                validate(instance=self.config, schema=SCHEMA)
+                VALIDATOR.validate(conf)
             except ValidationError as err:
-                logging.critial(err.message)
-                sys.exit(1)
-            except SchemaError as err:
-                logging.critial(err.message)
+                logging.critical(err.message)
                 sys.exit(1)
 
 
-    def single_run(self, config):
+    def get_api(self, idx):
+        """
+        Return the connected API client for a config instance
+        :param idx: Index of the config instance
+        :return: SolarmanApi
+        """
+        if idx not in self._apis:
+            api = SolarmanApi(self.config[idx])
+            try:
+                api.connect()
+            except Exception:
+                api.close()
+                raise
+            self._apis[idx] = api
+        return self._apis[idx]
+
+    def get_mqtt(self, idx):
+        """
+        Return the MQTT client for a config instance
+        :param idx: Index of the config instance
+        :return: Mqtt
+        """
+        if idx not in self._mqtts:
+            self._mqtts[idx] = Mqtt(self.config[idx]["mqtt"])
+        return self._mqtts[idx]
+
+    def single_run(self, idx):
         """
         Output current watts and kilowatts
+        :param idx: Index of the config instance
         :return:
         """
-        pvdata = SolarmanApi(config)
+        config = self.config[idx]
+        pvdata = self.get_api(idx)
+        pvdata.get_data()
 
         station_data = pvdata.station_realtime
         inverter_data = pvdata.device_current_data_inverter
-        logging.info(f"inverter_data: {inverter_data}")
         logger_data = pvdata.device_current_data_logger
-        logging.info(f"logger_data: {logger_data}")
+
+        logging.debug("inverter_data: %s", inverter_data)
+        logging.debug("logger_data: %s", logger_data)
 
         inverter_data_list = ConstructData(inverter_data).device_current_data
         logger_data_list = ConstructData(logger_data).device_current_data
@@ -90,42 +119,65 @@ class SolarmanPV:
 
         _t = time.strftime("%Y-%m-%d %H:%M:%S")
 
-        mqtt = Mqtt(config["mqtt"])
+        messages = []
 
         if station_data:
             if not station_data.get("success", False):
                 logging.warning(f"{_t} station_data request failed.  Response: {station_data}")
             else:
                 logging.info(f"{_t} station_data updated")
-                for i in station_data:
-                    mqtt.publish("/station/" + i, station_data[i])
-
+                messages.extend(self._topic_values("/station/", station_data))
 
         if inverter_data:
             if not inverter_data.get("success", False):
                 logging.warning(f"inverter_data request failed.  Response: {inverter_data}")
             else:
                 logging.info(f"{_t} inverter_data updated")
-                for i in inverter_data:
-                    mqtt.publish("/inverter/" + i, inverter_data[i])
-                mqtt.publish("/inverter/attributes",json.dumps(inverter_data_list))
+                messages.extend(self._topic_values("/inverter/", inverter_data))
+                messages.append(("/inverter/attributes", dumps(inverter_data_list)))
 
         if logger_data:
             if not logger_data.get("success", False):
                 logging.warning(f"logger_data request failed.  Response: {logger_data}")
             else:
                 logging.info(f"{_t} logger_data updated")
-                for i in logger_data:
-                    mqtt.publish("/logger/" + i, logger_data[i])
-                mqtt.publish("/logger/attributes",json.dumps(logger_data_list))
+                messages.extend(self._topic_values("/logger/", logger_data))
+                messages.append(("/logger/attributes", dumps(logger_data_list)))
+
+        self.get_mqtt(idx).publish_many(messages)
+
+    @staticmethod
+    def _topic_values(prefix, data):
+        """
+        Return (topic, value) pairs for the telemetry fields of a response
+        :param prefix: Topic prefix, e.g. /station/
+        :param data: API response
+        :return: list of (topic, value)
+        """
+        return [
+            (prefix + key, value)
+            for key, value in data.items()
+            if key not in RESPONSE_STATUS_FIELDS
+        ]
 
 
     def single_run_loop(self):
         """
         Perform single runs for all config instances
         """
-        for conf in self.config:
-            self.single_run(conf)
+        for idx in range(len(self.config)):
+            self.single_run(idx)
+
+    def close(self):
+        """
+        Close all API and MQTT connections
+        """
+        for api in self._apis.values():
+            api.close()
+        for mqtt in self._mqtts.values():
+            mqtt.disconnect()
+        self._apis.clear()
+        self._mqtts.clear()
 
     def daemon(self, interval):
         """
@@ -144,7 +196,18 @@ class SolarmanPV:
                 time.sleep(interval)
             except KeyboardInterrupt:
                 logging.info("Exiting on keyboard interrupt")
+                self.close()
                 sys.exit(0)
+            except SolarmanCredentialsError as error:
+                # retrying with the same credentials will not succeed
+                logging.critical("Credentials rejected: %s", str(error))
+                self.close()
+                sys.exit(1)
+            except SolarmanApiError as error:
+                # likely transient, keep the process alive and try again next interval;
+                # a client that failed to connect is not kept, so it reconnects then
+                logging.error("API request failed: %s", str(error))
+                time.sleep(interval)
             except Exception as error:  # pylint: disable=broad-except
                 logging.error("Error on start: %s", str(error))
                 sys.exit(1)
@@ -0,0 +1,374 @@
+"""Tests for the Solarman API client"""
+
+import http.server
+import io
+import json
+import os
+import sys
+import threading
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from solarman import api
+
+
+class FakeAdapter(BaseAdapter):
+    """Transport adapter answering requests from a handler function"""
+
+    def __init__(self, handler):
+        super().__init__()
+        self.handler = handler
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        status, body = self.handler(request)
+        response = requests.Response()
+        response.status_code = status
+        response.raw = io.BytesIO(json.dumps(body).encode())
+        response.request = request
+        response.url = request.url
+        return response
+
+    def close(self):
+        pass
+
+
+CONFIG = {
+    "appid": "123456789012345",
+    "secret": "s" * 32,
+    "username": "user@example.com",
+    "passhash": "p" * 64,
+    "stationId": 123456,
+}
+
+
+@pytest.fixture(name="solarman_api")
+def fixture_solarman_api(monkeypatch, tmp_path):
+    """SolarmanApi with the token cache in a temporary directory"""
+    monkeypatch.setattr(api, "TOKEN_CACHE_DIR", str(tmp_path))
+    client = api.SolarmanApi(CONFIG)
+    yield client
+    client.close()
+
+
+def test_concurrent_401_refreshes_token_once(solarman_api):
+    """Polling threads that all see an expired token request a single new one"""
+    token_requests = []
+    barrier = threading.Barrier(3)
+
+    def handler(request):
+        if request.path_url.startswith("/account/v1.0/token"):
+            token_requests.append(request)
+            return 200, {"success": True, "access_token": "new", "expires_in": "3600"}
+        if request.headers["Authorization"] == "bearer old":
+            # make sure all three requests were sent with the old token
+            barrier.wait(timeout=5)
+            return 401, {}
+        return 200, {"success": True}
+
+    solarman_api._session.mount("https://", FakeAdapter(handler))
+    solarman_api._set_token("old")
+
+    results = list(solarman_api._executor.map(
+        lambda _: solarman_api._make_request(
+            url=solarman_api._url_realtime, data=b"{}", retry_delay=60
+        ),
+        range(3),
+    ))
+
+    assert results == [{"success": True}] * 3
+    assert len(token_requests) == 1
+    assert solarman_api.token == "new"
+
+
+def write_token_cache(solarman_api, cached):
+    """Store cached directly in the client's token cache file"""
+    with open(solarman_api._token_cache, "w", encoding="utf-8") as cache_file:
+        json.dump(cached, cache_file)
+
+
+def read_token_cache(solarman_api):
+    """Return the contents of the client's token cache file"""
+    with open(solarman_api._token_cache, encoding="utf-8") as cache_file:
+        return json.load(cache_file)
+
+
+def token_handler(token_requests, token="new"):
+    """Handler answering token requests with token and anything else with success"""
+
+    def handler(request):
+        if request.path_url.startswith("/account/v1.0/token"):
+            token_requests.append(request)
+            return 200, {"success": True, "access_token": token, "expires_in": "3600"}
+        if request.headers["Authorization"] != "bearer " + token:
+            return 401, {}
+        return 200, {"success": True}
+
+    return handler
+
+
+def test_cached_token_is_used_until_it_expires(solarman_api):
+    """A cached token is used unless it expires within TOKEN_EXPIRY_MARGIN"""
+    expires_at = api.time.time() + api.TOKEN_EXPIRY_MARGIN + 600
+    write_token_cache(solarman_api, {"token": "cached", "expires_at": expires_at})
+    assert solarman_api._load_cached_token() == "cached"
+
+    expires_at = api.time.time() + api.TOKEN_EXPIRY_MARGIN - 1
+    write_token_cache(solarman_api, {"token": "cached", "expires_at": expires_at})
+    assert solarman_api._load_cached_token() is None
+
+
+@pytest.mark.parametrize("cached", [[], "token", None, 3600])
+def test_malformed_token_cache_is_ignored(solarman_api, cached):
+    """Valid JSON that is not an object does not break loading the cache"""
+    write_token_cache(solarman_api, cached)
+    assert solarman_api._load_cached_token() is None
+
+
+def test_token_cache_is_private(solarman_api):
+    """The token cache file is only readable by its owner"""
+    token_requests = []
+    solarman_api._session.mount("https://", FakeAdapter(token_handler(token_requests)))
+
+    token = solarman_api.get_token(CONFIG["appid"], CONFIG["secret"], CONFIG["username"], CONFIG["passhash"])
+    assert token == "new"
+    assert os.stat(solarman_api._token_cache).st_mode & 0o777 == 0o600
+    assert read_token_cache(solarman_api)["token"] == "new"
+
+
+def test_401_replaces_cached_token(solarman_api):
+    """A token rejected with 401 is dropped from the cache and replaced"""
+    token_requests = []
+    solarman_api._session.mount("https://", FakeAdapter(token_handler(token_requests)))
+    write_token_cache(solarman_api, {"token": "old", "expires_at": api.time.time() + 3600})
+    solarman_api._set_token(solarman_api._load_cached_token())
+
+    assert solarman_api._make_request(url=solarman_api._url_realtime, data=b"{}") == {"success": True}
+    assert len(token_requests) == 1
+    assert read_token_cache(solarman_api)["token"] == "new"
+
+
+def test_connect_does_not_retry_rejected_credentials(solarman_api, monkeypatch):
+    """A token response without access_token fails connect() right away"""
+    token_requests = []
+
+    def handler(request):
+        token_requests.append(request)
+        return 200, {"success": False, "code": "2101021", "msg": "auth invalid"}
+
+    monkeypatch.setattr(api.time, "sleep", lambda _: None)
+    solarman_api._session.mount("https://", FakeAdapter(handler))
+
+    with pytest.raises(api.SolarmanCredentialsError):
+        solarman_api.connect()
+    assert len(token_requests) == 1
+
+
+def test_connect_retries_failed_token_request_a_bounded_number_of_times(solarman_api, monkeypatch):
+    """Each connect() attempt sends one token request, without nested retries"""
+    token_requests = []
+    sleeps = []
+
+    def handler(request):
+        token_requests.append(request)
+        return 503, {}
+
+    monkeypatch.setattr(api.time, "sleep", sleeps.append)
+    solarman_api._session.mount("https://", FakeAdapter(handler))
+
+    with pytest.raises(api.SolarmanAuthError):
+        solarman_api.connect()
+    assert len(token_requests) == api.TOKEN_ATTEMPTS
+    assert sleeps == [1, 2, 4, 8]
+
+
+class StreamedResponse:
+    """Response stand-in delivering its body in fixed-size chunks"""
+
+    def __init__(self, body, chunk_size, headers=None):
+        self.content = body
+        self.chunk_size = chunk_size
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size):  # pylint: disable=unused-argument
+        for start in range(0, len(self.content), self.chunk_size):
+            yield self.content[start:start + self.chunk_size]
+
+
+def expected_current_data(doc):
+    """Return doc as loads() decodes it, with dataList rows reduced to name and value"""
+    data = api.loads(json.dumps(doc).encode())
+    if isinstance(data.get("dataList"), list):
+        data["dataList"] = [
+            {"name": row["name"], "value": row["value"]} for row in data["dataList"]
+        ]
+    return data
+
+
+CURRENT_DATA = {
+    "code": None,
+    "msg": None,
+    "success": True,
+    "requestId": "abc",
+    "deviceSn": "SN123",
+    "deviceId": 42,
+    "deviceState": 1,
+    "nested": {"a": [1, {"b": 2.5}], "item": {"name": "not a row"}},
+    "list": [1, "two", None, [3]],
+    "dataList": [
+        {"key": f"K{i}", "name": f"Name {i}", "value": f"{i}.5", "unit": "V"}
+        for i in range(200)
+    ],
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 4096])
+@pytest.mark.parametrize(
+    "doc",
+    [
+        CURRENT_DATA,
+        {**CURRENT_DATA, "dataList": None},
+        {**CURRENT_DATA, "dataList": []},
+        {key: value for key, value in CURRENT_DATA.items() if key != "dataList"},
+    ],
+    ids=["rows", "null", "empty", "missing"],
+)
+def test_decode_current_data_streamed(doc, chunk_size):
+    """Streaming gives the same result as loads(), whatever the chunk boundaries"""
+    pytest.importorskip("ijson")
+    response = StreamedResponse(json.dumps(doc).encode(), chunk_size)
+
+    assert api.decode_current_data(response) == expected_current_data(doc)
+
+
+def test_construct_data_drops_null_datalist():
+    """A null dataList is not left in the data published to MQTT"""
+    data = {"success": True, "dataList": None}
+
+    assert api.ConstructData(data).device_current_data == {}
+    assert data == {"success": True}
+
+
+@pytest.mark.parametrize(
+    "headers, streamed",
+    [
+        ({"Content-Length": "100"}, False),
+        ({"Content-Length": "100", "Content-Encoding": "gzip"}, True),
+        ({"Content-Length": str(api.STREAM_PARSE_THRESHOLD)}, True),
+        ({}, True),
+    ],
+)
+def test_decode_current_data_size_gate(headers, streamed):
+    """Only small uncompressed bodies skip the streaming parser"""
+    pytest.importorskip("ijson")
+    response = StreamedResponse(json.dumps(CURRENT_DATA).encode(), 4096, headers)
+
+    rows = api.decode_current_data(response)["dataList"]
+
+    assert ("key" not in rows[0]) is streamed
+
+
+def test_single_run_auth_failure_exits_and_closes(monkeypatch, tmp_path):
+    """--single logs an API error, closes its clients and exits with status 1"""
+    import solarman  # pylint: disable=import-outside-toplevel
+
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(CONFIG))
+    closed = []
+
+    def fail(_self):
+        raise api.SolarmanAuthError("Unable to get access token")
+
+    monkeypatch.setattr(solarman.SolarmanPV, "single_run_loop", fail)
+    monkeypatch.setattr(solarman.SolarmanPV, "close", lambda _self: closed.append(True))
+    monkeypatch.setattr(sys, "argv", ["run.py", "-s", "-f", str(config_file)])
+
+    with pytest.raises(SystemExit) as exit_info:
+        solarman.main()
+    assert exit_info.value.code == 1
+    assert closed == [True]
+
+
+@pytest.fixture(name="http_server")
+def fixture_http_server():
+    """Local HTTP server answering every POST with 503, counting the requests"""
+    requests_seen = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        """Always unavailable"""
+
+        def do_POST(self):  # pylint: disable=invalid-name
+            requests_seen.append(self.path)
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(503)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", requests_seen
+    server.shutdown()
+    server.server_close()
+
+
+def use_local_server(solarman_api, base_url):
+    """Point the client at base_url, keeping its real retrying adapter"""
+    solarman_api._session.mount("http://", solarman_api._session.get_adapter("https://"))
+    solarman_api._url_token = base_url + "/account/v1.0/token"
+    solarman_api._url_realtime = base_url + "/station/v1.0/realTime?language=en"
+
+
+def test_http_errors_are_not_retried_by_the_transport(solarman_api, http_server, monkeypatch):
+    """Each _make_request attempt is one POST, urllib3 does not retry 5xx"""
+    base_url, requests_seen = http_server
+    monkeypatch.setattr(api.time, "sleep", lambda _: None)
+    use_local_server(solarman_api, base_url)
+    solarman_api._station_body = b"{}"
+
+    assert solarman_api.get_station_realtime() is None
+    assert len(requests_seen) == 6
+
+
+def test_connect_sends_one_token_request_per_attempt(solarman_api, http_server, monkeypatch):
+    """connect() against an unavailable API sends TOKEN_ATTEMPTS token requests"""
+    base_url, requests_seen = http_server
+    monkeypatch.setattr(api.time, "sleep", lambda _: None)
+    use_local_server(solarman_api, base_url)
+
+    with pytest.raises(api.SolarmanAuthError):
+        solarman_api.connect()
+    assert len(requests_seen) == api.TOKEN_ATTEMPTS
+
+
+def test_get_data_refreshes_token_before_it_expires(solarman_api):
+    """get_data replaces a token expiring within TOKEN_EXPIRY_MARGIN before polling"""
+    token_requests = []
+    polled_with = []
+
+    def handler(request):
+        if request.path_url.startswith("/account/v1.0/token"):
+            token_requests.append(request)
+            return 200, {"success": True, "access_token": "new", "expires_in": "3600"}
+        polled_with.append(request.headers["Authorization"])
+        return 200, {"success": True}
+
+    solarman_api._session.mount("https://", FakeAdapter(handler))
+    write_token_cache(solarman_api, {"token": "old", "expires_at": api.time.time() + api.TOKEN_EXPIRY_MARGIN + 1})
+    solarman_api._set_token(solarman_api._load_cached_token())
+    solarman_api._station_body = b"{}"
+    solarman_api._poll_inverter = solarman_api._poll_logger = lambda: None
+
+    solarman_api.get_data()
+    assert not token_requests
+
+    solarman_api._token_expires_at = api.time.time() + api.TOKEN_EXPIRY_MARGIN - 1
+    solarman_api.get_data()
+    assert len(token_requests) == 1
+    assert polled_with == ["bearer old", "bearer new"]
+    assert read_token_cache(solarman_api)["token"] == "new"
@@ -0,0 +1,122 @@
+"""Tests for the SolarmanPV data collection and publishing"""
+
+import json
+
+import pytest
+
+from solarman import api, solarmanpv
+
+
+CONFIG = {
+    "name": "Test",
+    "url": "globalapi.solarmanpv.com",
+    "appid": "123456789012345",
+    "secret": "s" * 32,
+    "username": "user@example.com",
+    "passhash": "p" * 64,
+    "stationId": 123456,
+    "inverterId": "1234567890",
+    "loggerId": "1234567890",
+    "mqtt": {
+        "broker": "localhost",
+        "port": 1883,
+        "topic": "solarmanpv",
+        "username": "",
+        "password": "",
+    },
+}
+
+
+def make_pv(tmp_path, config):
+    """SolarmanPV loaded from a config file holding config"""
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps(config))
+    return solarmanpv.SolarmanPV(str(config_file))
+
+
+def test_daemon_exits_on_rejected_credentials(tmp_path, monkeypatch):
+    """Rejected credentials stop the daemon instead of retrying every interval"""
+    pv = make_pv(tmp_path, CONFIG)
+    closed = []
+    sleeps = []
+
+    def fail():
+        raise api.SolarmanCredentialsError("No access token in response: auth invalid")
+
+    monkeypatch.setattr(pv, "single_run_loop", fail)
+    monkeypatch.setattr(pv, "close", lambda: closed.append(True))
+    def sleep(seconds):
+        # a daemon waiting for the next interval would retry forever, stop it
+        sleeps.append(seconds)
+        raise RuntimeError("daemon kept running")
+
+    monkeypatch.setattr(solarmanpv.time, "sleep", sleep)
+
+    with pytest.raises(SystemExit) as exit_info:
+        pv.daemon(60)
+    assert exit_info.value.code == 1
+    assert closed == [True]
+    assert not sleeps
+
+
+def test_validate_config_accepts_valid_config(tmp_path):
+    """A complete config passes validation without exiting"""
+    make_pv(tmp_path, [CONFIG, dict(CONFIG, name="Second")]).validate_config()
+
+
+def test_validate_config_exits_on_missing_field(tmp_path):
+    """A config without appid fails validation with exit status 1"""
+    config = {key: value for key, value in CONFIG.items() if key != "appid"}
+
+    with pytest.raises(SystemExit) as exit_info:
+        make_pv(tmp_path, config).validate_config()
+    assert exit_info.value.code == 1
+
+
+class StubApi:  # pylint: disable=too-few-public-methods
+    """Connected API client returning fixed responses"""
+
+    def __init__(self):
+        self.station_realtime = {
+            "success": True, "code": None, "msg": None, "generationPower": 1500.0,
+        }
+        self.device_current_data_inverter = {
+            "success": True, "code": None, "msg": None, "deviceSn": "SN1",
+            "dataList": [{"key": "DV1", "name": "DC Voltage PV1", "value": "230.1", "unit": "V"}],
+        }
+        self.device_current_data_logger = {
+            "success": True, "code": None, "msg": None, "deviceSn": "SN2",
+            "dataList": [{"key": "LSI", "name": "Signal", "value": "80", "unit": "%"}],
+        }
+
+    def get_data(self):
+        """Responses are preset"""
+
+
+class StubMqtt:  # pylint: disable=too-few-public-methods
+    """MQTT client recording the published messages"""
+
+    def __init__(self):
+        self.published = []
+
+    def publish_many(self, messages):
+        """Record messages instead of sending them"""
+        self.published.extend(messages)
+
+
+def test_single_run_publishes_telemetry(tmp_path):
+    """single_run publishes one message per field, without the response status"""
+    pv = make_pv(tmp_path, CONFIG)
+    mqtt = StubMqtt()
+    pv._apis[0] = StubApi()
+    pv._mqtts[0] = mqtt
+
+    pv.single_run(0)
+
+    assert mqtt.published == [
+        ("/station/generationPower", 1500.0),
+        ("/inverter/deviceSn", "SN1"),
+        ("/inverter/attributes", api.dumps({"DC_Voltage_PV1": "230.1"})),
+        ("/logger/deviceSn", "SN2"),
+        ("/logger/attributes", api.dumps({"Signal": "80"})),
+    ]